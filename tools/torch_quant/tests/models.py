@@ -13,6 +13,7 @@ from functools import partial
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from torch_quant.graph import GraphModContext
 from torch_quant.module import fx_trace
 from torch_quant.observer import Observer
@@ -106,3 +107,26 @@ class UntraceableSimpleModule(nn.Module):
         x = self.untraceable_sub(x)
         x = self.linear(x)
         return x
+
+
+class TrainingBranchModule(nn.Module):
+    def __init__(self) -> None:
+        super().__init__()
+        self.linear = nn.Linear(4, 4)
+
+    def forward(self, x):
+        x = self.linear(x)
+        if self.training:
+            x = F.dropout(x, p=0.5)
+        return x
+
+
+class SharedLinearModule(nn.Module):
+    def __init__(self) -> None:
+        super().__init__()
+        self.linear = nn.Linear(4, 4)
+
+    def forward(self, x):
+        x = self.linear(x)
+        x = self.linear(x)
+        return x
@@ -10,18 +10,47 @@
 # limitations under the License.
 
 import unittest
+from functools import partial
+from unittest import mock
 
 import torch
 import torch.nn as nn
 from more_itertools import ilen
 from parameterized import parameterized
 from tests.models import SimpleModule, create_ctx
+from torch_quant.graph import (
+    GraphModContext,
+    fold_qdq,
+    insert_act_observer,
+    insert_w_observer,
+    quantizable_module_to_observed,
+    set_qconfig
+)
+from torch_quant.observer import (
+    BiasObserver,
+    MinMaxObserver,
+    PerChannelMinMaxObserver,
+    toggle_observer
+)
 
 
 class DummyModule(nn.Module):
     ...
 
 
+class CountedObserver(MinMaxObserver):
+    num_created = 0
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        CountedObserver.num_created += 1
+
+
+class NoopObserver(MinMaxObserver):
+    def forward(self, x):
+        return x
+
+
 class GraphModContextTest(unittest.TestCase):
     def test_nodes_by_module_type(self):
         ctx = create_ctx(SimpleModule())
@@ -62,6 +91,81 @@ class GraphModContextTest(unittest.TestCase):
         m2 = ctx.get_or_create_module('conv.dummy', DummyModule)
         self.assertIs(m1, m2)
 
+    def test_get_or_create_module_on_device(self):
+        ctx = create_ctx(SimpleModule())
+        device = torch.device('meta')
+        m = ctx.get_or_create_module('conv.ob', MinMaxObserver, device)
+        self.assertEqual(m.min_val.device, device)
+        self.assertIs(ctx.get_or_create_module('conv.ob', MinMaxObserver, device), m)
+
+    def test_insert_observer_on_module_device(self):
+        device = torch.device('meta')
+        model = SimpleModule().to(device)
+        ctx = GraphModContext(
+            gm=torch.fx.symbolic_trace(model),
+            root=model,
+            act_ob_ctr=NoopObserver,
+            w_ob_ctr=NoopObserver,
+        )
+        ctx.modify_graph([set_qconfig, insert_act_observer, insert_w_observer])
+        observers = {n: m for n, m in ctx.gm.named_modules() if isinstance(m, NoopObserver)}
+        for name in ['x_ob', 'conv_ob', 'conv.w_ob', 'linear.w_ob']:
+            self.assertIn(name, observers)
+        for ob in observers.values():
+            self.assertEqual(ob.min_val.device, device)
+
+    def test_get_or_create_module_without_instantiation(self):
+        ctx = create_ctx(SimpleModule())
+        ob = CountedObserver()
+        ctx.add_module('conv.ob', ob)
+        CountedObserver.num_created = 0
+        m = ctx.get_or_create_module('conv.ob', partial(CountedObserver, dtype=torch.qint8))
+        self.assertIs(m, ob)
+        self.assertEqual(CountedObserver.num_created, 0)
+
+    def test_modify_graph_fused(self):
+        model = SimpleModule()
+        ctx = GraphModContext(
+            gm=torch.fx.symbolic_trace(model),
+            root=model,
+            act_ob_ctr=MinMaxObserver,
+            w_ob_ctr=PerChannelMinMaxObserver,
+            bias_ob_ctr=BiasObserver,
+        )
+        ctx.modify_graph_fused([
+            set_qconfig,
+            insert_act_observer,
+            insert_w_observer,
+            quantizable_module_to_observed,
+        ])
+        self.assertEqual(ilen(ctx.quantizable_nodes()), 3)
+        for node in ctx.quantizable_nodes():
+            m = ctx.modules[node.target]
+            self.assertEqual(type(m).__module__, 'torch_quant.observed_module')
+            self.assertIsInstance(m.w_ob, PerChannelMinMaxObserver)
+
+        dummy_input = torch.randn((1, 2, 5, 5))
+        toggle_observer(ctx.gm, observe=False, fake_quant=False)
+        torch.testing.assert_close(ctx.gm(dummy_input), model(dummy_input))
+
+    def test_modify_graph_recompile_once(self):
+        model = SimpleModule()
+        ctx = GraphModContext(
+            gm=torch.fx.symbolic_trace(model),
+            root=model,
+            act_ob_ctr=MinMaxObserver,
+        )
+        with mock.patch.object(ctx.gm, 'recompile', wraps=ctx.gm.recompile) as recompile:
+            ctx.modify_graph([insert_act_observer, fold_qdq])
+            self.assertEqual(recompile.call_count, 1)
+            ctx.modify_graph([fold_qdq], recompile=False)
+            self.assertEqual(recompile.call_count, 1)
+            fold_qdq(ctx)
+            self.assertEqual(recompile.call_count, 2)
+        dummy_input = torch.randn((1, 2, 5, 5))
+        toggle_observer(ctx.gm, observe=False, fake_quant=False)
+        torch.testing.assert_close(ctx.gm(dummy_input), ctx.root(dummy_input))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -12,7 +12,11 @@
 import unittest
 
 import torch
-from torch_quant.observer import MinMaxObserver, PerChannelMinMaxObserver
+from torch_quant.observer import (
+    MinMaxObserver,
+    MovingAverageMinMaxObserver,
+    PerChannelMinMaxObserver
+)
 
 
 class MinMaxObserverTest(unittest.TestCase):
@@ -47,5 +51,20 @@ class PerChannelMinMaxObserverTest(unittest.TestCase):
         self.assertTrue(torch.equal(torch.zeros_like(scale, dtype=torch.int32), ob.qparams.zero_point))
 
 
+class MovingAverageMinMaxObserverTest(unittest.TestCase):
+    def test_basic(self):
+        ob = MovingAverageMinMaxObserver(averaging_constant=0.5)
+        data1 = torch.rand((8, 1024)) * 2 - 1
+        data2 = torch.rand((8, 1024)) * 4 - 2
+        ob(data1)
+        self.assertTrue(torch.equal(ob.min_val, torch.min(data1)))
+        self.assertTrue(torch.equal(ob.max_val, torch.max(data1)))
+        ob(data2)
+        min_val = torch.min(data1) + 0.5 * (torch.min(data2) - torch.min(data1))
+        max_val = torch.max(data1) + 0.5 * (torch.max(data2) - torch.max(data1))
+        torch.testing.assert_close(ob.min_val, min_val)
+        torch.testing.assert_close(ob.max_val, max_val)
+
+
 if __name__ == '__main__':
     unittest.main()
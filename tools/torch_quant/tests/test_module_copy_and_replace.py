@@ -15,7 +15,7 @@ import torch
 from parameterized import parameterized
 
 from tests.models import SimpleModule
-from torch_quant.module import ModuleFilter, copy_and_replace, fx_trace
+from torch_quant.module import ModuleFilter, copy_and_replace, fx_trace, replace_inplace
 
 
 class CopyAndReplaceTest(unittest.TestCase):
@@ -37,6 +37,19 @@ class CopyAndReplaceTest(unittest.TestCase):
             self.assertIs(getattr(copied, name), mapping[name].gm)
         self.assertTrue(torch.equal(model(dummy_input), copied(dummy_input)))
 
+    @parameterized.expand([(['conv'],), (['conv', 'sub', 'linear'],)])
+    def test_replace_inplace(self, include_names) -> None:
+        model = SimpleModule()
+        dummy_input = torch.randn((1, 2, 5, 5))
+        original_output = model(dummy_input)
+        module_filter = ModuleFilter(include_names=include_names)
+        mapping = fx_trace(model, module_filter)
+        replaced = replace_inplace(model, mapping)
+        self.assertIs(replaced, model)
+        for name in include_names:
+            self.assertIs(getattr(model, name), mapping[name].gm)
+        self.assertTrue(torch.equal(original_output, replaced(dummy_input)))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -9,27 +9,38 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
+import gc
 import tempfile
 import unittest
 from functools import partial
 from typing import List, Optional
+from unittest import mock
 
 import torch
+import torch.nn.functional as F
 import torch.nn.intrinsic as nni
 import torch.nn.intrinsic.quantized as nniq
 import torch.nn.quantized._reference as nnqr
 from parameterized import parameterized
-from tests.models import SimpleModule, SubModule, UntraceableSimpleModule
+from tests.models import (
+    SharedLinearModule,
+    SimpleModule,
+    SubModule,
+    TrainingBranchModule,
+    UntraceableSimpleModule
+)
 from torch_quant.amp_module import AmpModule
-from torch_quant.module import ModuleFilter
-from torch_quant.observer import toggle_observer
+from torch_quant.module import ModuleFilter, fx_trace
+from torch_quant.observer import HistogramObserver, Observer, toggle_observer
 from torch_quant.quantizer import (
     DEFAULT_ACT_OB_CTR,
     DEFAULT_QAT_OB_CTR,
     DEFAULT_W_OB_CTR,
     Backend,
     Device,
-    Quantizer
+    Quantizer,
+    get_default_ctr
 )
 
 
@@ -145,7 +156,11 @@ class QuantizerTest(unittest.TestCase):
                 self.assertTrue(isinstance(amp_modules[name], AmpModule))
         amp_output = amp_model(dummy_input)
         self.assertTrue(torch.equal(original_output, amp_output))
-        quantizer.fallback(amp_model, num=2)
+        quantizer.fallback(amp_model, num=1)
+        self.assertEqual(len(quantizer.module_filter.exclude_names), 1)
+        with mock.patch('torch_quant.quantizer.rank_fallback_candidates') as rank:
+            quantizer.fallback(amp_model, num=2)
+            rank.assert_not_called()
         self.assertEqual(len(quantizer.module_filter.exclude_names), 2)
 
         quant_model = quantizer.quantize(model)
@@ -243,6 +258,198 @@ class QuantizerTest(unittest.TestCase):
         elif backend == Backend.FBGEMM:
             self.assertTrue(isinstance(quant_model.sub.conv, nniq.ConvReLU2d))
 
+    @parameterized_with_backends()
+    def test_trace_cache(self, backend: Backend) -> None:
+        model = SimpleModule()
+        quantizer = Quantizer(backend=backend)
+        dummy_input = torch.randn((1, 2, 5, 5))
+        with mock.patch('torch_quant.quantizer.fx_trace', wraps=fx_trace) as traced:
+            calib_model = quantizer.calib(model)
+            calib_model(dummy_input)
+            calib_code = calib_model.code
+            quant_model = quantizer.quantize(model)
+            self.assertEqual(traced.call_count, 1)
+            self.assertIsNot(quant_model.graph, calib_model.graph)
+            self.assertEqual(calib_code, calib_model.code)
+
+            quantizer.invalidate_trace_cache()
+            quant_model2 = quantizer.quantize(model)
+            self.assertEqual(traced.call_count, 2)
+            self.assertTrue(torch.equal(quant_model(dummy_input), quant_model2(dummy_input)))
+
+            quantizer.fallback(quantizer.amp(model), num=1)
+            self.assertEqual(traced.call_count, 2)
+            quantizer.quantize(model)
+            self.assertEqual(traced.call_count, 3)
+
+    @parameterized_with_backends()
+    def test_amp_shared_module(self, backend: Backend) -> None:
+        model = SharedLinearModule()
+        dummy_input = torch.randn((2, 4))
+        quantizer = Quantizer(backend=backend)
+        quantizer.calib(model)(dummy_input)
+        amp_model = quantizer.amp(model)
+        self.assertIsInstance(amp_model.linear, AmpModule)
+        torch.testing.assert_close(amp_model(dummy_input), model(dummy_input))
+
+    @parameterized_with_backends()
+    def test_trace_cache_training_mode(self, backend: Backend) -> None:
+        model = TrainingBranchModule()
+        quantizer = Quantizer(backend=backend)
+        with mock.patch('torch_quant.quantizer.fx_trace', wraps=fx_trace) as traced:
+            model.eval()
+            quantizer.calib(model)(torch.randn((2, 4)))
+            quantizer.tracer = torch.fx.Tracer()
+            quantizer.calib(model)
+            self.assertEqual(traced.call_count, 2)
+            model.train()
+            qat_model = quantizer.qat(model)
+            self.assertEqual(traced.call_count, 3)
+        dropouts = [n for n in qat_model.graph.nodes if n.target == F.dropout]
+        self.assertEqual(len(dropouts), 1)
+
+    def test_trace_cache_released(self) -> None:
+        model = SimpleModule()
+        quantizer = Quantizer()
+        quantizer.calib(model)
+        self.assertEqual(len(quantizer._trace_cache), 1)
+        del model
+        gc.collect()
+        self.assertEqual(len(quantizer._trace_cache), 0)
+
+    @parameterized_with_backends()
+    def test_parallel_submodules(self, backend: Backend) -> None:
+        module_filter = ModuleFilter(include_names=['traceable_sub', 'untraceable_sub.linear_relu'])
+        model = UntraceableSimpleModule()
+        dummy_input = torch.randn((1, 2, 5, 5))
+        outputs = []
+        for parallel_submodules in [False, True]:
+            m = copy.deepcopy(model)
+            quantizer = Quantizer(
+                backend=backend, module_filter=module_filter,
+                parallel_submodules=parallel_submodules)
+            quantizer.calib(m)(dummy_input)
+            outputs.append(quantizer.quantize(m)(dummy_input))
+        self.assertTrue(torch.equal(outputs[0], outputs[1]))
+
+    @parameterized_with_backends()
+    def test_quantize_inplace(self, backend: Backend) -> None:
+        module_filter = ModuleFilter(include_names=['traceable_sub', 'untraceable_sub.linear_relu'])
+        model = UntraceableSimpleModule()
+        dummy_input = torch.randn((1, 2, 5, 5))
+        quantizer = Quantizer(backend=backend, module_filter=module_filter)
+        quantizer.calib(model)(dummy_input)
+        quant_output = quantizer.quantize(model)(dummy_input)
+        quant_model = quantizer.quantize(model, inplace=True)
+        self.assertIs(quant_model, model)
+        self.assertIsInstance(model.traceable_sub, torch.fx.GraphModule)
+        self.assertTrue(torch.equal(quant_output, quant_model(dummy_input)))
+
+    @parameterized_with_backends()
+    def test_calib_inplace(self, backend: Backend) -> None:
+        module_filter = ModuleFilter(include_names=['traceable_sub', 'untraceable_sub.linear_relu'])
+        model = UntraceableSimpleModule()
+        dummy_input = torch.randn((1, 2, 5, 5))
+        quantizer = Quantizer(backend=backend, module_filter=module_filter)
+        calib_model = quantizer.calib(model, inplace=True)
+        self.assertIs(calib_model, model)
+        calib_model(dummy_input)
+        with self.assertRaises(RuntimeError):
+            quantizer.quantize(model)
+
+    @parameterized.expand([(Backend.DISC, False), (Backend.REFERENCE, True)])
+    def test_delete_unused_submodules(self, backend: Backend, called: bool) -> None:
+        model = SimpleModule()
+        dummy_input = torch.randn((1, 2, 5, 5))
+        quantizer = Quantizer(backend=backend)
+        quantizer.calib(model)(dummy_input)
+        delete_all_unused_submodules = torch.fx.GraphModule.delete_all_unused_submodules
+        with mock.patch.object(
+            torch.fx.GraphModule, 'delete_all_unused_submodules', autospec=True,
+            side_effect=delete_all_unused_submodules,
+        ) as delete:
+            quant_model = quantizer.quantize(model)
+        self.assertEqual(delete.called, called)
+        torch.jit.trace(quant_model, dummy_input)
+
+    @parameterized_with_backends()
+    def test_default_ctr(self, backend: Backend) -> None:
+        self.assertIs(
+            get_default_ctr(DEFAULT_ACT_OB_CTR, Device.X86, backend),
+            DEFAULT_ACT_OB_CTR[Device.X86][backend],
+        )
+        with mock.patch.dict(DEFAULT_ACT_OB_CTR[Device.X86], {backend: HistogramObserver}):
+            self.assertIs(Quantizer(backend=backend).act_ob_ctr, HistogramObserver)
+        with self.assertRaises(RuntimeError):
+            Quantizer(backend=Backend.REFERENCE, device=Device.GPU)
+
+    @parameterized_with_backends()
+    def test_calibration_method(self, backend: Backend) -> None:
+        model = SimpleModule()
+        dummy_input = torch.randn((1, 2, 5, 5))
+        quantizer = Quantizer(backend=backend, calibration_method='histogram')
+        calib_model = quantizer.calib(model)
+        calib_model(dummy_input)
+        self.assertIsInstance(calib_model.x_ob, HistogramObserver)
+        default_act_ob = DEFAULT_ACT_OB_CTR[Device.X86][backend]()
+        self.assertEqual(calib_model.x_ob.dtype, default_act_ob.dtype)
+        self.assertEqual(calib_model.x_ob.qscheme, default_act_ob.qscheme)
+        quant_output = quantizer.quantize(model)(dummy_input)
+        torch.testing.assert_close(quant_output, model(dummy_input), rtol=0.1, atol=0.5)
+        with self.assertRaises(ValueError):
+            Quantizer(backend=backend, calibration_method='unknown')
+
+    @parameterized_with_backends()
+    def test_without_quantizable_nodes(self, backend: Backend) -> None:
+        model = torch.nn.Sequential(torch.nn.ReLU(), torch.nn.Flatten())
+        quantizer = Quantizer(backend=backend)
+        dummy_input = torch.randn((1, 2, 5, 5))
+        original_output = model(dummy_input)
+        calib_model = quantizer.calib(model)
+        calib_model(dummy_input)
+        quant_model = quantizer.quantize(model)
+        for m in [model, calib_model, quant_model]:
+            self.assertFalse(any(isinstance(sub, Observer) for sub in m.modules()))
+        self.assertTrue(torch.equal(original_output, quant_model(dummy_input)))
+
+    @parameterized_with_backends()
+    def test_calibration_only(self, backend: Backend) -> None:
+        model = SimpleModule()
+        quantizer = Quantizer(backend=backend)
+        dummy_input = torch.randn((1, 2, 5, 5))
+        calib_model = quantizer.calib(model)
+        with quantizer.calibration_only(calib_model) as m:
+            m(dummy_input)
+            self.assertTrue(calib_model.x_ob.observe)
+            self.assertFalse(calib_model.x_ob.fake_quant)
+        self.assertFalse(calib_model.x_ob.observe)
+        self.assertTrue(calib_model.x_ob.fake_quant)
+        scale = calib_model.x_ob.scale.clone()
+        calib_model(dummy_input * 10)
+        self.assertTrue(torch.equal(scale, calib_model.x_ob.scale))
+
+    @parameterized_with_backends()
+    def test_calib_freeze_on_eval(self, backend: Backend) -> None:
+        model = SimpleModule()
+        quantizer = Quantizer(backend=backend)
+        dummy_input = torch.randn((1, 2, 5, 5))
+        calib_model = quantizer.calib(model, freeze_on_eval=True)
+        calib_model.train()
+        calib_model(dummy_input)
+        self.assertTrue(calib_model.x_ob.observe)
+        self.assertFalse(calib_model.x_ob.fake_quant)
+        scale = calib_model.x_ob.scale.clone()
+
+        calib_model.eval()
+        calib_model(dummy_input * 10)
+        self.assertFalse(calib_model.x_ob.observe)
+        self.assertTrue(calib_model.x_ob.fake_quant)
+        self.assertTrue(torch.equal(scale, calib_model.x_ob.scale))
+
+        calib_model.train()
+        calib_model(dummy_input)
+        self.assertTrue(calib_model.x_ob.observe)
+
     def _test_observer_type(self, t, target_t):
         self.assertEqual(type(t), type(target_t))
         self.assertEqual(t.dtype, target_t.dtype)
@@ -10,7 +10,7 @@
 # limitations under the License.
 
 import logging
-from typing import List
+from typing import List, Optional
 
 import torch
 import torch.nn as nn
@@ -49,17 +49,24 @@ class AmpModule(nn.Module):
         return y
 
 
-def get_fallback_names(root: nn.Module, num: int) -> List[str]:
-    modules = dict(root.named_modules())
-    candidates = [k for k, v in modules.items() if isinstance(v, AmpModule)]
-    if len(candidates) < num:
+def rank_fallback_candidates(root: nn.Module) -> List[str]:
+    """
+    Names of all AmpModules in root, sorted by accumulated noise in descending order.
+    """
+    candidates = [(k, v.noise) for k, v in root.named_modules() if isinstance(v, AmpModule)]
+    sorted_noises = sorted(candidates, key=lambda x: x[1], reverse=True)
+    return [k[0] for k in sorted_noises]
+
+
+def get_fallback_names(
+    root: nn.Module, num: int, ranking: Optional[List[str]] = None
+) -> List[str]:
+    ranking = rank_fallback_candidates(root) if ranking is None else ranking
+    if len(ranking) < num:
         LOGGER.warning(
-            f"No module be quantized. There are only {len(candidates)} "
+            f"No module be quantized. There are only {len(ranking)} "
             f"quantizable modules, but fallback number is {num}."
         )
-        num = len(candidates)
+        num = len(ranking)
     LOGGER.info(f"Fallback {num} modules to float precision.")
-    noises = {name: modules[name].noise for name in candidates}
-    sorted_noises = sorted(noises.items(), key=lambda x: x[1], reverse=True)
-    fallback_names = [k[0] for k in sorted_noises[:num]]
-    return fallback_names
+    return ranking[:num]
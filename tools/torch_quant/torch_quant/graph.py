@@ -10,10 +10,24 @@
 # limitations under the License.
 
 import copy
+import itertools
 import logging
 from collections import defaultdict
-from functools import partial
-from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Type
+from contextlib import contextmanager
+from functools import partial, wraps
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type
+)
 
 import torch
 import torch.nn as nn
@@ -26,7 +40,7 @@ from torch.quantization import DEFAULT_REFERENCE_STATIC_QUANT_MODULE_MAPPINGS, Q
 from torch_quant.amp_module import AmpModule
 from torch_quant.module import ModuleFilter
 from torch_quant.observed_module import OB_MODULE_MAPPING
-from torch_quant.observer import Observer
+from torch_quant.observer import Observer, ObserverSpec
 
 LOGGER = logging.getLogger(__name__)
 
@@ -73,7 +87,43 @@ def _register_buffer(root: nn.Module, full_path: str, tensor: torch.Tensor) -> N
     parent.register_buffer(name, tensor)
 
 
+def _constructor_type(constructor: Callable[..., nn.Module]) -> Optional[Type[nn.Module]]:
+    if isinstance(constructor, ObserverSpec):
+        return constructor.cls
+    if isinstance(constructor, partial):
+        constructor = constructor.func
+    if isinstance(constructor, type):
+        return constructor
+    return None
+
+
+def _module_device(m: Optional[nn.Module]) -> Optional[torch.device]:
+    if m is None:
+        return None
+    for t in itertools.chain(m.parameters(), m.buffers()):
+        return t.device
+    return None
+
+
 GraphModPass = Callable[['GraphModContext'], None]
+NodeVisitor = Callable[['GraphModContext', Node], None]
+
+
+def quantizable_node_pass(visit_node: NodeVisitor) -> GraphModPass:
+    """
+    Make a graph modification pass from a visitor, which only modifies the given
+    quantizable node (e.g. replaces its module or attaches observers to it) and
+    never changes the graph structure. Such passes expose the visitor as
+    `visit_node`, so that `GraphModContext.modify_graph_fused` can apply several
+    of them in a single traversal.
+    """
+    @wraps(visit_node)
+    def _pass(ctx: 'GraphModContext') -> None:
+        for node in ctx.visitable_quantizable_nodes():
+            visit_node(ctx, node)
+
+    _pass.visit_node = visit_node
+    return _pass
 
 
 class GraphModContext:
@@ -98,6 +148,9 @@ class GraphModContext:
         # to make it a callable function.
         self.is_override_module = is_override_module
         self.is_override_qconfig = is_override_qconfig
+        # targets of call_module nodes erased by passes, their modules may be unused
+        self.removed_modules: Set[str] = set()
+        self._defer_recompile = False
 
     @property
     def quantizable_module_types(self) -> Tuple[nn.Module]:
@@ -112,7 +165,9 @@ class GraphModContext:
             types += _quantizable_fusion_types(types)
             if self.module_filter:
                 if self.module_filter.include_op_types:
-                    include_op_types = self.module_filter.include_op_types
+                    # do not extend the list in place, it may be shared with the
+                    # module filters of other contexts
+                    include_op_types = list(self.module_filter.include_op_types)
                     include_op_types += _quantizable_fusion_types(include_op_types)
                     types = list(set(types) & set(include_op_types))
                 elif self.module_filter.exclude_op_types:
@@ -120,12 +175,26 @@ class GraphModContext:
             self._quantizable_module_types = tuple(types)
             return self._quantizable_module_types
 
+    @property
+    def _filter_names(self) -> Tuple[Optional[FrozenSet[str]], Optional[FrozenSet[str]]]:
+        try:
+            return self._filter_name_sets
+        except AttributeError:
+            include_names = exclude_names = None
+            if self.module_filter:
+                if self.module_filter.include_names:
+                    include_names = frozenset(self.module_filter.include_names)
+                if self.module_filter.exclude_names:
+                    exclude_names = frozenset(self.module_filter.exclude_names)
+            self._filter_name_sets = (include_names, exclude_names)
+            return self._filter_name_sets
+
     def is_quantizable(self, module_name: str) -> bool:
-        if self.module_filter:
-            if self.module_filter.include_names:
-                return module_name in self.module_filter.include_names
-            if self.module_filter.exclude_names:
-                return module_name not in self.module_filter.exclude_names
+        include_names, exclude_names = self._filter_names
+        if include_names:
+            return module_name in include_names
+        if exclude_names:
+            return module_name not in exclude_names
         return True
 
     def quantizable_nodes(self) -> Iterable[Node]:
@@ -133,9 +202,74 @@ class GraphModContext:
             if self.is_quantizable(node.target):
                 yield node
 
-    def modify_graph(self, passes: Iterable[GraphModPass]) -> None:
-        for p in passes:
-            p(self)
+    def visitable_quantizable_nodes(self) -> Iterable[Node]:
+        """
+        Same as `quantizable_nodes`, but safe to use while visitors replace modules:
+        nodes are collected up front, and each one is skipped if its module is no longer
+        quantizable when it is reached, e.g. a module called by several nodes (shared
+        weights) has been replaced by an AmpModule when visiting a previous node.
+        """
+        for node in list(self.quantizable_nodes()):
+            if isinstance(self.modules.get(node.target), self.quantizable_module_types):
+                yield node
+
+    def has_quantizable_nodes(self) -> bool:
+        return any(True for _ in self.quantizable_nodes())
+
+    def recompile(self) -> None:
+        """
+        Recompile gm after its graph is rewritten. Passes applied by `modify_graph` or
+        `modify_graph_fused` only edit the graph, so gm is recompiled once after all of
+        them instead of once per pass.
+        """
+        if not self._defer_recompile:
+            self.gm.recompile()
+
+    @contextmanager
+    def _deferring_recompile(self, recompile: bool) -> Iterator[None]:
+        deferred = self._defer_recompile
+        self._defer_recompile = True
+        try:
+            yield
+        finally:
+            self._defer_recompile = deferred
+        if recompile:
+            self.recompile()
+
+    def modify_graph(self, passes: Iterable[GraphModPass], recompile: bool = True) -> None:
+        """
+        Apply passes one by one. Set `recompile` to False if more passes will be applied
+        later (e.g. by another `modify_graph` call), then the caller should recompile.
+        """
+        with self._deferring_recompile(recompile):
+            for p in passes:
+                p(self)
+
+    def modify_graph_fused(self, passes: Iterable[GraphModPass], recompile: bool = True) -> None:
+        """
+        Same as `modify_graph`, but consecutive passes created by `quantizable_node_pass`
+        share one traversal over quantizable nodes, each node is visited by these passes
+        in order. Other passes (e.g. those rewriting graph structure) are still applied
+        one by one.
+        """
+        visitors: List[NodeVisitor] = []
+
+        def _visit_quantizable_nodes():
+            if visitors:
+                for node in self.visitable_quantizable_nodes():
+                    for visit_node in visitors:
+                        visit_node(self, node)
+                visitors.clear()
+
+        with self._deferring_recompile(recompile):
+            for p in passes:
+                visit_node = getattr(p, 'visit_node', None)
+                if visit_node is None:
+                    _visit_quantizable_nodes()
+                    p(self)
+                else:
+                    visitors.append(visit_node)
+            _visit_quantizable_nodes()
 
     def nodes_by_module_type(self, module_types: Iterable[Type[nn.Module]]) -> Iterable[Node]:
         for node in self.gm.graph.nodes:
@@ -158,6 +292,23 @@ class GraphModContext:
             if any(node.target == m for m in method_names):
                 yield node
 
+    def _called_modules(self) -> Set[str]:
+        return {node.target for node in self.gm.graph.nodes if node.op == 'call_module'}
+
+    def erase_node(self, node: Node) -> None:
+        if node.op == 'call_module':
+            self.removed_modules.add(node.target)
+        self.gm.graph.erase_node(node)
+
+    def eliminate_dead_code(self) -> None:
+        if self.removed_modules:
+            # unused modules are removed anyway, no need to find out which ones are dead
+            self.gm.graph.eliminate_dead_code()
+            return
+        called_modules = self._called_modules()
+        if self.gm.graph.eliminate_dead_code():
+            self.removed_modules.update(called_modules - self._called_modules())
+
     def get_attr(self, full_path: str) -> Any:
         parent, name = _locate_parent(self.gm, full_path)
         return getattr(parent, name)
@@ -177,7 +328,17 @@ class GraphModContext:
         _register_buffer(self.gm, full_path, cloned)
         _register_buffer(self.root, full_path, cloned)
 
-    def get_or_create_module(self, full_path: str, constructor: Callable[[], nn.Module]) -> nn.Module:
+    def get_or_create_module(
+        self,
+        full_path: str,
+        constructor: Callable[[], nn.Module],
+        device: Optional[torch.device] = None,
+    ) -> nn.Module:
+        """
+        Get the module at full_path, or create it by constructor. Newly created (or
+        converted) modules are moved to `device` if it is given, e.g. the device of the
+        observed tensor, so observers never copy data across devices.
+        """
         for n, m in self.root.named_modules(remove_duplicate=False):
             if n == full_path:
                 if self.is_override_module:
@@ -189,13 +350,20 @@ class GraphModContext:
                     # then a new observer will be instantiated.
                     # TODO (bohua.cbh): consider the situation that a module is referenced and
                     # is duplicate in `named_modules()`
-                    if not isinstance(m, type(constructor())) and hasattr(m, "qparams") and \
-                            hasattr(constructor.func, "from_qparams"):
-                        m = constructor.func.from_qparams(m.qparams)
+                    # only instantiate the constructor if its type is unknown (e.g. a
+                    # factory function), observers can be costly to construct
+                    ob_type = _constructor_type(constructor) or type(constructor())
+                    if not isinstance(m, ob_type) and hasattr(m, "qparams") and \
+                            hasattr(ob_type, "from_qparams"):
+                        m = ob_type.from_qparams(m.qparams)
+                        if device is not None:
+                            m = m.to(device)
                 self.add_module(full_path, m)
                 return m
 
         m = constructor()
+        if device is not None:
+            m = m.to(device)
         self.add_module(full_path, m)
         return m
 
@@ -204,12 +372,11 @@ class GraphModContext:
 
 # set QConfig to quantizable modules so we can reuse nn.intrinsic/qat modules
 # TODO(litan.ls): support other observer type and dtype
-def set_qconfig(ctx: GraphModContext) -> None:
-    is_override_qconfig = ctx.is_override_qconfig
-    for node in ctx.quantizable_nodes():
+@quantizable_node_pass
+def set_qconfig(ctx: GraphModContext, node: Node) -> None:
+    if ctx.is_override_qconfig:
         m = ctx.modules.get(node.target)
-        if is_override_qconfig:
-            m.qconfig = QConfig(activation=None, weight=ctx.w_ob_ctr)
+        m.qconfig = QConfig(activation=None, weight=ctx.w_ob_ctr)
 
 
 def fuse_modules(ctx: GraphModContext) -> None:
@@ -232,7 +399,7 @@ def fuse_modules(ctx: GraphModContext) -> None:
             if type(first_mod) != fusion_pattern[0]:
                 continue
             last_nd.replace_all_uses_with(first_nd)
-            ctx.gm.graph.erase_node(last_nd)
+            ctx.erase_node(last_nd)
             fused_mod = fused_type(first_mod, last_mod)
             ctx.replace_module(first_nd.target, fused_mod)
 
@@ -241,11 +408,17 @@ def insert_act_observer(ctx: GraphModContext) -> None:
     # key: activation node to be observed, value: consumers of observed activation
     # note that not all consumers of original activation need consum observed activation.
     act_nodes: Dict[Node, Set[Node]] = defaultdict(set)
+    # key: activation node to be observed, value: device of the quantizable module
+    # producing or consuming it
+    act_devices: Dict[Node, Optional[torch.device]] = dict()
     for node in ctx.quantizable_nodes():
+        device = _module_device(ctx.modules.get(node.target))
         for arg in node.args:
             if isinstance(arg, Node):
                 act_nodes[arg].add(node)
+                act_devices.setdefault(arg, device)
         act_nodes[node].update(node.users)
+        act_devices.setdefault(node, device)
     for act in act_nodes:
         # TODO(litan.ls): act.op == call_method
         if act.op == 'call_function':
@@ -253,14 +426,14 @@ def insert_act_observer(ctx: GraphModContext) -> None:
         else:
             ob_path = f'{act.target}_ob'
 
-        _ = ctx.get_or_create_module(ob_path, ctx.act_ob_ctr)
+        _ = ctx.get_or_create_module(ob_path, ctx.act_ob_ctr, act_devices[act])
         with ctx.gm.graph.inserting_after(act):
             ob_node = ctx.gm.graph.call_module(ob_path, (act, ))
         act.replace_all_uses_with(
             ob_node, delete_user_cb=lambda user: user in act_nodes[act])
         LOGGER.debug(f'insert ob({ob_path}) after {act.op}({act.target})')
     # TODO(litan.ls): handle output node
-    ctx.gm.recompile()
+    ctx.recompile()
 
 
 def _is_fused_module(m: nn.Module) -> Tuple[nn.Module, Optional[nn.Module]]:
@@ -272,40 +445,43 @@ def _is_fused_module(m: nn.Module) -> Tuple[nn.Module, Optional[nn.Module]]:
     return m, fused_module
 
 
-def insert_w_observer(ctx: GraphModContext) -> None:
-    def _create_observer(
-        ob_path: str,
-        ob_ctr: Optional[Callable[..., Observer]],
-        params: torch.nn.Parameter,
-        fused_module: Optional[nn.Module],
-    ) -> Optional[Observer]:
-        ob = ctx.modules.get(ob_path)
-        no_ob = ob is None
-        if no_ob or ctx.is_override_module:
-            ob = ctx.get_or_create_module(ob_path, ob_ctr)
-            if fused_module:
-                fused_module._modules.pop(ob_path.split('.')[-1])
-            if no_ob:
-                ob.set_mode(observe=True, fake_quant=False)
-                ob(params)
-        return ob
+def _create_w_observer(
+    ctx: GraphModContext,
+    ob_path: str,
+    ob_ctr: Optional[Callable[..., Observer]],
+    params: torch.nn.Parameter,
+    fused_module: Optional[nn.Module],
+) -> Optional[Observer]:
+    ob = ctx.modules.get(ob_path)
+    no_ob = ob is None
+    if no_ob or ctx.is_override_module:
+        ob = ctx.get_or_create_module(ob_path, ob_ctr, params.device)
+        if fused_module:
+            fused_module._modules.pop(ob_path.split('.')[-1])
+        if no_ob:
+            ob.set_mode(observe=True, fake_quant=False)
+            ob(params)
+    return ob
+
+
+@quantizable_node_pass
+def insert_w_observer(ctx: GraphModContext, node: Node) -> None:
+    m, fused_module = _is_fused_module(ctx.modules[node.target])
+    w_ob_path = f'{node.target}.w_ob'
+    w_ob = _create_w_observer(ctx, w_ob_path, ctx.w_ob_ctr, m.weight, fused_module)
+    if getattr(m, 'bias', None) is not None and ctx.bias_ob_ctr:
+        bias_ob_path = f'{node.target}.bias_ob'
+        act = node.args[0]
+        act_name = act.name if act.op == 'call_function' else act.target
+        act_ob = ctx.modules.get(act_name)
+        if act_ob is None or not isinstance(act_ob, Observer):
+            act_ob = ctx.modules[f'{act_name}_ob']
+        bias_ob_ctr = partial(ctx.bias_ob_ctr, w_ob, act_ob)
+        _create_w_observer(ctx, bias_ob_path, bias_ob_ctr, m.bias, fused_module)
 
-    for node in ctx.quantizable_nodes():
-        m, fused_module = _is_fused_module(ctx.modules[node.target])
-        w_ob_path = f'{node.target}.w_ob'
-        w_ob = _create_observer(w_ob_path, ctx.w_ob_ctr, m.weight, fused_module)
-        if getattr(m, 'bias', None) is not None and ctx.bias_ob_ctr:
-            bias_ob_path = f'{node.target}.bias_ob'
-            act = node.args[0]
-            act_name = act.name if act.op == 'call_function' else act.target
-            act_ob = ctx.modules.get(act_name)
-            if act_ob is None or not isinstance(act_ob, Observer):
-                act_ob = ctx.modules[f'{act_name}_ob']
-            bias_ob_ctr = partial(ctx.bias_ob_ctr, w_ob, act_ob)
-            _create_observer(bias_ob_path, bias_ob_ctr, m.bias, fused_module)
-
-
-def quantizable_module_to_observed(ctx: GraphModContext) -> None:
+
+@quantizable_node_pass
+def quantizable_module_to_observed(ctx: GraphModContext, node: Node) -> None:
     """
     Replace quantizable modules with observed version.
 
@@ -316,21 +492,20 @@ def quantizable_module_to_observed(ctx: GraphModContext) -> None:
 
     Args:
         ctx (GraphModContext): Context object for graph modification.
+        node (Node): Quantizable node to be observed.
     """
-    for node in ctx.quantizable_nodes():
-        src, fused_module = _is_fused_module(ctx.modules[node.target])
-        dst_type = OB_MODULE_MAPPING.get(type(src))
-        if dst_type is None:
-            raise ValueError(f'{type(src)} cannot be observed.')
-        act_ob = ctx.modules[node.args[0].target]
-        w_ob = ctx.modules[f'{node.target}.w_ob']
-        bias_ob = ctx.modules.get(f'{node.target}.bias_ob') if ctx.bias_ob_ctr else None
-        dst = dst_type.from_float(src, w_ob, bias_ob)
-        if fused_module is None:
-            ctx.replace_module(node.target, dst)
-        else:
-            fused_module[0] = dst
-    ctx.gm.recompile()
+    src, fused_module = _is_fused_module(ctx.modules[node.target])
+    dst_type = OB_MODULE_MAPPING.get(type(src))
+    if dst_type is None:
+        raise ValueError(f'{type(src)} cannot be observed.')
+    act_ob = ctx.modules[node.args[0].target]
+    w_ob = ctx.modules[f'{node.target}.w_ob']
+    bias_ob = ctx.modules.get(f'{node.target}.bias_ob') if ctx.bias_ob_ctr else None
+    dst = dst_type.from_float(src, w_ob, bias_ob)
+    if fused_module is None:
+        ctx.replace_module(node.target, dst)
+    else:
+        fused_module[0] = dst
 
 
 def observer_to_qdq(ctx: GraphModContext) -> None:
@@ -347,43 +522,42 @@ def observer_to_qdq(ctx: GraphModContext) -> None:
             q = ctx.gm.graph.call_function(torch.quantize_per_tensor, q_inputs)
             dq = ctx.gm.graph.call_method('dequantize', (q,))
             node.replace_all_uses_with(dq)
-            ctx.gm.graph.erase_node(node)
+            ctx.erase_node(node)
         LOGGER.debug(
             f'''ob({node.target}) -> qdp: scale={ob.qparams.scale}, zero_point={ob.qparams.zero_point}''')
-    ctx.gm.recompile()
-
-
-def quantizable_module_to_ref(ctx: GraphModContext) -> None:
-    for node in ctx.quantizable_nodes():
-        src, fused_module = _is_fused_module(ctx.modules[node.target])
-        dst_type = DEFAULT_REFERENCE_STATIC_QUANT_MODULE_MAPPINGS.get(
-            type(src))
-        if dst_type is None:
-            raise ValueError(
-                f'module type {type(src)} is not supported for static quantization.')
-        w_ob = ctx.modules.get(f'{node.target}.w_ob')
-        if w_ob is None:
-            w_ob = src.qconfig.weight()
-            w_ob(src.weight)
-        # update qscheme, since we don't have symmetric quant qscheme in quantized Tensor
-        # https://github.com/pytorch/pytorch/blob/v1.13.1/torch/ao/quantization/utils.py#L138
-        wq_dict = w_ob.qparams._asdict()
-        sym_to_aff_map = {
-            torch.per_tensor_symmetric: torch.per_tensor_affine,
-            torch.per_channel_symmetric: torch.per_channel_affine,
-        }
-        wq_dict['qscheme'] = sym_to_aff_map.get(wq_dict['qscheme'], wq_dict['qscheme'])
-        wq_dict['axis'] = wq_dict.pop('ch_axis')
-        wq_dict['scale'] = wq_dict['scale'].to(torch.float32)
-        wq_dict['zero_point'] = wq_dict['zero_point'].to(torch.int32)
-        dst = dst_type.from_float(src, wq_dict)
-        # TODO(litan.ls): copy forward hooks
-        if fused_module is None:
-            ctx.replace_module(node.target, dst)
-        else:
-            fused_module[0] = dst
-        LOGGER.debug(f'to_ref: {node.target}({type(src)}->{dst_type})')
-    ctx.gm.recompile()
+    ctx.recompile()
+
+
+@quantizable_node_pass
+def quantizable_module_to_ref(ctx: GraphModContext, node: Node) -> None:
+    src, fused_module = _is_fused_module(ctx.modules[node.target])
+    dst_type = DEFAULT_REFERENCE_STATIC_QUANT_MODULE_MAPPINGS.get(
+        type(src))
+    if dst_type is None:
+        raise ValueError(
+            f'module type {type(src)} is not supported for static quantization.')
+    w_ob = ctx.modules.get(f'{node.target}.w_ob')
+    if w_ob is None:
+        w_ob = src.qconfig.weight()
+        w_ob(src.weight)
+    # update qscheme, since we don't have symmetric quant qscheme in quantized Tensor
+    # https://github.com/pytorch/pytorch/blob/v1.13.1/torch/ao/quantization/utils.py#L138
+    wq_dict = w_ob.qparams._asdict()
+    sym_to_aff_map = {
+        torch.per_tensor_symmetric: torch.per_tensor_affine,
+        torch.per_channel_symmetric: torch.per_channel_affine,
+    }
+    wq_dict['qscheme'] = sym_to_aff_map.get(wq_dict['qscheme'], wq_dict['qscheme'])
+    wq_dict['axis'] = wq_dict.pop('ch_axis')
+    wq_dict['scale'] = wq_dict['scale'].to(torch.float32)
+    wq_dict['zero_point'] = wq_dict['zero_point'].to(torch.int32)
+    dst = dst_type.from_float(src, wq_dict)
+    # TODO(litan.ls): copy forward hooks
+    if fused_module is None:
+        ctx.replace_module(node.target, dst)
+    else:
+        fused_module[0] = dst
+    LOGGER.debug(f'to_ref: {node.target}({type(src)}->{dst_type})')
 
 
 def q_ref_dq_to_fbgemm(ctx: GraphModContext) -> None:
@@ -420,8 +594,8 @@ def q_ref_dq_to_fbgemm(ctx: GraphModContext) -> None:
     for node, users in qdq_nodes.items():
         node.replace_all_uses_with(
             node.args[0], delete_user_cb=lambda user: user in users)
-    ctx.gm.graph.eliminate_dead_code()
-    ctx.gm.recompile()
+    ctx.eliminate_dead_code()
+    ctx.recompile()
 
 
 def fold_qdq(ctx: GraphModContext) -> None:
@@ -430,29 +604,28 @@ def fold_qdq(ctx: GraphModContext) -> None:
         q = dq.args[0]
         if q.op == 'call_function' and q.target in [torch.quantize_per_tensor]:
             dq.replace_all_uses_with(q.args[0])
-            ctx.gm.graph.erase_node(dq)
-            ctx.gm.graph.erase_node(q)
-    ctx.gm.graph.eliminate_dead_code()
-    ctx.gm.recompile()
-
-
-def quantizable_module_to_amp(ctx: GraphModContext) -> None:
-    for node in ctx.quantizable_nodes():
-        src, fused_module = _is_fused_module(ctx.modules[node.target])
-        dst_type = OB_MODULE_MAPPING.get(type(src))
-        if dst_type is None:
-            raise ValueError(f'{type(src)} cannot be observed.')
-        act = node.args[0]
-        act_name = act.name if act.op == 'call_function' else act.target
-        act_ob = ctx.modules[f'{act_name}_ob']
-        out_ob = ctx.modules[f'{node.target}_ob']
-        w_ob = ctx.modules[f'{node.target}.w_ob']
-        bias_ob = ctx.modules.get(f'{node.target}.bias_ob') if ctx.bias_ob_ctr else None
-        dst = dst_type.from_float(src, w_ob, bias_ob)
-        if fused_module is not None:
-            copied = copy.deepcopy(fused_module)
-            copied[0] = dst
-            dst = copied
-        amp = AmpModule(ctx.modules[node.target], dst, act_ob, out_ob)
-        ctx.replace_module(node.target, amp)
-    ctx.gm.recompile()
+            ctx.erase_node(dq)
+            ctx.erase_node(q)
+    ctx.eliminate_dead_code()
+    ctx.recompile()
+
+
+@quantizable_node_pass
+def quantizable_module_to_amp(ctx: GraphModContext, node: Node) -> None:
+    src, fused_module = _is_fused_module(ctx.modules[node.target])
+    dst_type = OB_MODULE_MAPPING.get(type(src))
+    if dst_type is None:
+        raise ValueError(f'{type(src)} cannot be observed.')
+    act = node.args[0]
+    act_name = act.name if act.op == 'call_function' else act.target
+    act_ob = ctx.modules[f'{act_name}_ob']
+    out_ob = ctx.modules[f'{node.target}_ob']
+    w_ob = ctx.modules[f'{node.target}.w_ob']
+    bias_ob = ctx.modules.get(f'{node.target}.bias_ob') if ctx.bias_ob_ctr else None
+    dst = dst_type.from_float(src, w_ob, bias_ob)
+    if fused_module is not None:
+        copied = copy.deepcopy(fused_module)
+        copied[0] = dst
+        dst = copied
+    amp = AmpModule(ctx.modules[node.target], dst, act_ob, out_ob)
+    ctx.replace_module(node.target, amp)
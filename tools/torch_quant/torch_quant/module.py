@@ -10,7 +10,7 @@
 # limitations under the License.
 
 import copy
-from typing import Dict, List, NamedTuple, Optional, Type
+from typing import Dict, List, NamedTuple, Optional, Tuple, Type
 
 import torch.nn as nn
 from torch.fx import GraphModule, Tracer
@@ -68,16 +68,17 @@ class ModuleFilter:
         self.exclude_op_types = exclude_op_types
 
 
-def submodule_filter(module_filter: ModuleFilter, module_name: str) -> ModuleFilter:
-    def _submodule_names(names, module_name: str) -> Optional[List[str]]:
-        """
-        If module name is 'foo', turn full path 'foo.bar.name' into 'bar.name'
-        """
-        if names and module_name:
-            lstrip_func = lambda x: x.replace(f'{module_name}.', '', 1)
-            names = [lstrip_func(m) for m in names if m.startswith(f'{module_name}.')]
-        return names or None
+def _submodule_names(names: Optional[List[str]], module_name: str) -> Optional[List[str]]:
+    """
+    If module name is 'foo', turn full path 'foo.bar.name' into 'bar.name'
+    """
+    if names and module_name:
+        prefix = f'{module_name}.'
+        names = [m[len(prefix):] for m in names if m.startswith(prefix)]
+    return names or None
 
+
+def submodule_filter(module_filter: ModuleFilter, module_name: str) -> ModuleFilter:
     _submodule_filter = ModuleFilter(
         include_names=_submodule_names(module_filter.include_names, module_name),
         include_classes=module_filter.include_classes,
@@ -97,8 +98,9 @@ class PatchTracer:
         exclude_classes: Optional[List[Type[nn.Module]]] = None,
     ):
         self.tracer = tracer
-        self.exclude_names = exclude_names
-        self.exclude_classes = exclude_classes
+        # is_leaf_module is queried for every module call during tracing
+        self.exclude_names = frozenset(exclude_names) if exclude_names else None
+        self.exclude_classes = frozenset(exclude_classes) if exclude_classes else None
 
     def __enter__(self):
         self.tracer.exclude_names = self.exclude_names
@@ -133,12 +135,15 @@ def fx_trace(
         return {'': TracePair(gm=GraphModule(root, fx_graph), m=root)}
     else:
         in_names, in_types = module_filter.include_names, module_filter.include_classes
+        in_names = frozenset(in_names) if in_names else None
         ex_names, ex_types = module_filter.exclude_names, module_filter.exclude_classes
         if in_names or in_types:
             trace_mapping: Dict[str, TracePair] = dict()
+            # trace submodules one by one, Tracer.trace patches torch.nn.Module globally
+            # (e.g. __call__ and __getattr__), thus it is not thread safe
             for n, m in root.named_modules():
                 if (in_names and n in in_names) or (in_types and type(m) in in_types):
-                    module_ex_names = submodule_filter(module_filter, n).exclude_names
+                    module_ex_names = _submodule_names(ex_names, n)
                     if module_ex_names or ex_types:
                         with PatchTracer(tracer, module_ex_names, ex_types) as tracer:
                             fx_graph = tracer.trace(copy.deepcopy(m))
@@ -152,21 +157,23 @@ def fx_trace(
             return {'': TracePair(gm=GraphModule(root, fx_graph), m=root)}
 
 
-def copy_and_replace(root: nn.Module, trace_mapping: Dict[str, TracePair]) -> nn.Module:
-    def _parent_name(name):
-        """
-        Turn 'foo.bar.name' into ['foo.bar', 'name']
-        """
-        r = name.rsplit('.', 1)
-        if len(r) == 1:
-            return '', r[0]
-        else:
-            return r[0], r[1]
+def _parent_name(name: str) -> Tuple[str, str]:
+    """
+    Turn 'foo.bar.name' into ['foo.bar', 'name']
+    """
+    r = name.rsplit('.', 1)
+    if len(r) == 1:
+        return '', r[0]
+    else:
+        return r[0], r[1]
+
+
+def _update_module(modules: Dict[str, nn.Module], target: str, new_module: nn.Module) -> None:
+    parent_name, name = _parent_name(target)
+    setattr(modules[parent_name], name, new_module)
 
-    def _update_module(modules, target, new_module):
-        parent_name, name = _parent_name(target)
-        setattr(modules[parent_name], name, new_module)
 
+def copy_and_replace(root: nn.Module, trace_mapping: Dict[str, TracePair]) -> nn.Module:
     if '' in trace_mapping:
         return trace_mapping[''].gm
     copied = copy.deepcopy(root)
@@ -176,3 +183,16 @@ def copy_and_replace(root: nn.Module, trace_mapping: Dict[str, TracePair]) -> nn
         _update_module(root_modules, name, traced.m)
         _update_module(copied_modules, name, traced.gm)
     return copied
+
+
+def replace_inplace(root: nn.Module, trace_mapping: Dict[str, TracePair]) -> nn.Module:
+    """
+    Same as `copy_and_replace`, but replace the traced submodules of root itself
+    instead of those of a deep copy, which avoids doubling the memory of large models.
+    """
+    if '' in trace_mapping:
+        return trace_mapping[''].gm
+    root_modules = dict(root.named_modules())
+    for name, traced in trace_mapping.items():
+        _update_module(root_modules, name, traced.gm)
+    return root
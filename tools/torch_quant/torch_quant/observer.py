@@ -12,7 +12,7 @@
 import logging
 from abc import ABC
 from functools import partial
-from typing import NamedTuple, Optional, Tuple
+from typing import Any, Dict, NamedTuple, Optional, Tuple, Type
 
 import torch
 import torch.nn as nn
@@ -135,30 +135,30 @@ class Observer(torch.nn.Module, ABC):
             return torch.tensor([1.0], device=min_val.device.type), torch.tensor([0], device=min_val.device.type)
 
         q_min, q_max = self.q_min, self.q_max
-        min_val_neg = torch.min(min_val, torch.zeros_like(min_val))
-        max_val_pos = torch.max(max_val, torch.zeros_like(max_val))
-
-        device = min_val_neg.device
-        scale = torch.ones(min_val_neg.size(), dtype=torch.float32, device=device)
-        zero_point = torch.zeros(min_val_neg.size(), dtype=torch.int32, device=device)
+        min_val_neg = torch.clamp(min_val, max=0.)
+        max_val_pos = torch.clamp(max_val, min=0.)
 
+        # all qparams are calculated on the whole (per-channel) min/max tensors at once
         if self.symmetric:
             max_val_pos = torch.max(-min_val_neg, max_val_pos)
             scale = max_val_pos / (float(q_max - q_min) / 2)
-            scale = torch.max(scale, self.eps)
-            if self.dtype == torch.quint8:
-                zero_point = zero_point.new_full(zero_point.size(), 128)
+            scale.clamp_(min=self.eps)
+            zero_point = torch.full_like(
+                min_val_neg, 128 if self.dtype == torch.quint8 else 0, dtype=torch.int32
+            )
         else:
             scale = (max_val_pos - min_val_neg) / float(q_max - q_min)
-            scale = torch.max(scale, self.eps)
+            scale.clamp_(min=self.eps)
             zero_point = q_min - torch.round(min_val_neg / scale).to(torch.int32)
-            zero_point = torch.clamp(zero_point, q_min, q_max)
-
-        LOGGER.debug(
-            f'calc qparams: min_val={self.min_val}, max_val={self.max_val}, '
-            f'q_min={self.q_min}, q_max={self.q_max}, bit={self.bit}, '
-            f'signed={self.signed}, scale={scale}, zero_point={zero_point}'
-        )
+            zero_point.clamp_(q_min, q_max)
+
+        # formatting tensors copies them to host, so only do it when debugging
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug(
+                f'calc qparams: min_val={self.min_val}, max_val={self.max_val}, '
+                f'q_min={self.q_min}, q_max={self.q_max}, bit={self.bit}, '
+                f'signed={self.signed}, scale={scale}, zero_point={zero_point}'
+            )
         return scale, zero_point
 
     @classmethod
@@ -176,6 +176,22 @@ def toggle_observer(root: nn.Module, *, observe: bool, fake_quant: bool) -> None
             m.set_mode(observe=observe, fake_quant=fake_quant)
 
 
+class ObserverSpec(NamedTuple):
+    """
+    Observer constructor with preset keyword arguments. Calling it builds a new
+    observer, so it can be used wherever an observer constructor is expected.
+    """
+    cls: Type[Observer]
+    kwargs: Dict[str, Any]
+
+    def build(self, **extra: Any) -> Observer:
+        if extra:
+            return self.cls(**{**self.kwargs, **extra})
+        return self.cls(**self.kwargs)
+
+    __call__ = build
+
+
 DTYPE_TO_BIT_SIGN = {
     torch.qint8: (8, True),
     torch.quint8: (8, False),
@@ -198,11 +214,14 @@ class MinMaxObserver(Observer):
         self.register_buffer("scale", torch.tensor(1.))
         self.register_buffer("zero_point", torch.tensor(0, dtype=torch.int32))
 
+    def _update_min_max(self, min_val: torch.Tensor, max_val: torch.Tensor) -> None:
+        self.min_val.copy_(torch.min(min_val, self.min_val))
+        self.max_val.copy_(torch.max(max_val, self.max_val))
+
     def forward(self, x):
         if self.observe:
             min_val, max_val = torch.aminmax(x.detach().to(self.min_val.dtype))
-            self.min_val.copy_(torch.min(min_val, self.min_val))
-            self.max_val.copy_(torch.max(max_val, self.max_val))
+            self._update_min_max(min_val, max_val)
             scale, zero_point = self._calculate_qparams(self.min_val, self.max_val)
             self.scale.copy_(scale)
             self.zero_point.copy_(zero_point)
@@ -212,6 +231,28 @@ class MinMaxObserver(Observer):
             return x
 
 
+class MovingAverageMinMaxObserver(MinMaxObserver):
+    """
+    Track the moving average of min/max values, i.e.
+    min_val = min_val + averaging_constant * (cur_min_val - min_val)
+    It is much cheaper than HistogramObserver while being robust to outliers
+    in a few batches.
+    """
+
+    def __init__(self, averaging_constant: float = 0.01, dtype: torch.dtype = torch.qint8,
+                 qscheme: torch.qscheme = torch.per_tensor_symmetric, **kwargs) -> None:
+        super().__init__(dtype, qscheme, **kwargs)
+        self.averaging_constant = averaging_constant
+
+    def _update_min_max(self, min_val: torch.Tensor, max_val: torch.Tensor) -> None:
+        if self.min_val == float("inf") and self.max_val == float("-inf"):
+            self.min_val.copy_(min_val)
+            self.max_val.copy_(max_val)
+        else:
+            self.min_val.add_(self.averaging_constant * (min_val - self.min_val))
+            self.max_val.add_(self.averaging_constant * (max_val - self.max_val))
+
+
 class PerChannelMinMaxObserver(Observer):
     def __init__(self, ch_axis=0, dtype: torch.dtype = torch.qint8,
                  qscheme: torch.qscheme = torch.per_channel_symmetric, **kwargs) -> None:
@@ -275,7 +316,7 @@ class BiasObserver(Observer):
     def forward(self, x):
         if self.observe:
             scale = self.w_ob.scale * self.act_ob.scale
-            if self.per_channel:
+            if self.per_channel and self.scale.shape != scale.shape:
                 self.scale.data = torch.ones_like(scale)
                 self.zero_point.data = torch.zeros_like(scale)
             self.scale.copy_(scale)
@@ -9,17 +9,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import logging
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from enum import Enum
 from functools import partial
-from typing import Callable, Dict, NamedTuple, Optional
+from typing import Any, Callable, Dict, Hashable, Iterator, List, NamedTuple, Optional, Tuple
 
 import torch
 import torch.nn as nn
-from torch.fx import GraphModule, Tracer
-from torch_quant.amp_module import get_fallback_names
+from torch.fx import Graph, GraphModule, Tracer
+from torch_quant.amp_module import get_fallback_names, rank_fallback_candidates
 from torch_quant.graph import (
     GraphModContext,
+    GraphModPass,
     fold_qdq,
     fuse_modules,
     insert_act_observer,
@@ -31,13 +38,22 @@ from torch_quant.graph import (
     quantizable_module_to_ref,
     set_qconfig
 )
-from torch_quant.module import ModuleFilter, copy_and_replace, fx_trace, submodule_filter
+from torch_quant.module import (
+    ModuleFilter,
+    TracePair,
+    copy_and_replace,
+    fx_trace,
+    replace_inplace,
+    submodule_filter
+)
 from torch_quant.observer import (
     BiasObserver,
     HistogramObserver,
     LSQObserver,
     MinMaxObserver,
+    MovingAverageMinMaxObserver,
     Observer,
+    ObserverSpec,
     PerChannelMinMaxObserver,
     toggle_observer
 )
@@ -59,19 +75,21 @@ class Device(Enum):
 
 
 DEFAULT_X86_ACT_OB_CTR: Dict[Backend, Callable[..., Observer]] = {
-    Backend.REFERENCE: partial(MinMaxObserver, dtype=torch.quint8, qscheme=torch.per_tensor_affine),
-    Backend.DISC: partial(MinMaxObserver, dtype=torch.qint8, qscheme=torch.per_tensor_symmetric),
-    Backend.FBGEMM: partial(HistogramObserver, dtype=torch.quint8, qscheme=torch.per_tensor_affine),
+    Backend.REFERENCE: ObserverSpec(
+        MinMaxObserver, {'dtype': torch.quint8, 'qscheme': torch.per_tensor_affine}),
+    Backend.DISC: ObserverSpec(MinMaxObserver, {'dtype': torch.qint8, 'qscheme': torch.per_tensor_symmetric}),
+    Backend.FBGEMM: ObserverSpec(
+        MovingAverageMinMaxObserver, {'dtype': torch.quint8, 'qscheme': torch.per_tensor_affine}),
 }
 
 
 DEFAULT_AARCH64_ACT_OB_CTR: Dict[Backend, Callable[..., Observer]] = {
-    Backend.DISC: partial(MinMaxObserver, dtype=torch.qint8, qscheme=torch.per_tensor_symmetric),
+    Backend.DISC: ObserverSpec(MinMaxObserver, {'dtype': torch.qint8, 'qscheme': torch.per_tensor_symmetric}),
 }
 
 
 DEFAULT_GPU_ACT_OB_CTR: Dict[Backend, Callable[..., Observer]] = {
-    Backend.DISC: partial(MinMaxObserver, dtype=torch.qint8, qscheme=torch.per_tensor_symmetric),
+    Backend.DISC: ObserverSpec(MinMaxObserver, {'dtype': torch.qint8, 'qscheme': torch.per_tensor_symmetric}),
 }
 
 
@@ -83,9 +101,12 @@ DEFAULT_ACT_OB_CTR = {
 
 
 DEFAULT_X86_W_OB_CTR: Dict[Backend, Callable[..., Observer]] = {
-    Backend.REFERENCE: partial(MinMaxObserver, dtype=torch.quint8, qscheme=torch.per_tensor_affine),
-    Backend.DISC: partial(PerChannelMinMaxObserver, dtype=torch.qint8, qscheme=torch.per_channel_symmetric),
-    Backend.FBGEMM: partial(PerChannelMinMaxObserver, dtype=torch.qint8, qscheme=torch.per_channel_symmetric),
+    Backend.REFERENCE: ObserverSpec(
+        MinMaxObserver, {'dtype': torch.quint8, 'qscheme': torch.per_tensor_affine}),
+    Backend.DISC: ObserverSpec(
+        PerChannelMinMaxObserver, {'dtype': torch.qint8, 'qscheme': torch.per_channel_symmetric}),
+    Backend.FBGEMM: ObserverSpec(
+        PerChannelMinMaxObserver, {'dtype': torch.qint8, 'qscheme': torch.per_channel_symmetric}),
 }
 
 
@@ -93,12 +114,12 @@ DEFAULT_AARCH64_W_OB_CTR: Dict[Backend, Callable[..., Observer]] = {
     # Numerical overflow happens on GEMMLowpOutputStage when use per-channel symmetric
     # So we use per-tensor symmetric for weight
     # https://github.com/ARM-software/ComputeLibrary/issues/1012
-    Backend.DISC: partial(MinMaxObserver, dtype=torch.qint8, qscheme=torch.per_tensor_symmetric),
+    Backend.DISC: ObserverSpec(MinMaxObserver, {'dtype': torch.qint8, 'qscheme': torch.per_tensor_symmetric}),
 }
 
 
 DEFAULT_GPU_W_OB_CTR: Dict[Backend, Callable[..., Observer]] = {
-    Backend.DISC: partial(MinMaxObserver, dtype=torch.qint8, qscheme=torch.per_tensor_symmetric),
+    Backend.DISC: ObserverSpec(MinMaxObserver, {'dtype': torch.qint8, 'qscheme': torch.per_tensor_symmetric}),
 }
 
 
@@ -112,6 +133,25 @@ DEFAULT_W_OB_CTR = {
 DEFAULT_BIAS_OB_CTR = BiasObserver
 DEFAULT_QAT_OB_CTR = LSQObserver
 
+CALIBRATION_METHODS = ('minmax', 'histogram')
+
+
+def _get_kwargs(ob_ctr: Callable[..., Observer]) -> Dict[str, Any]:
+    if isinstance(ob_ctr, ObserverSpec):
+        return ob_ctr.kwargs
+    if isinstance(ob_ctr, partial):
+        return ob_ctr.keywords
+    return dict()
+
+
+def _qat_ob_ctr(
+    qat_ob_ctr: Callable[..., Observer], ptq_ob_ctr: Callable[..., Observer]
+) -> Callable[..., Observer]:
+    # Generally we will keep the qat's dtype & qscheme settings the same as ptq.
+    settings = ('qscheme', 'dtype')
+    kwds = {k: v for k, v in _get_kwargs(ptq_ob_ctr).items() if k in settings}
+    return partial(qat_ob_ctr, **kwds)
+
 
 def get_default_ctr(all_ctr, device, backend):
     if device not in all_ctr:
@@ -140,7 +180,98 @@ def get_observer_types(
     return ObserverTypes(act_ob_ctr=act_ob_ctr, w_ob_ctr=w_ob_ctr, bias_ob_ctr=bias_ob_ctr)
 
 
+def _module_filter_key(module_filter: Optional[ModuleFilter]) -> Hashable:
+    if module_filter is None:
+        return None
+    fields = (
+        module_filter.include_names,
+        module_filter.include_classes,
+        module_filter.include_op_types,
+        module_filter.exclude_names,
+        module_filter.exclude_classes,
+        module_filter.exclude_op_types,
+    )
+    return tuple(tuple(f) if f is not None else None for f in fields)
+
+
+def _module_structure_key(model: nn.Module) -> Hashable:
+    # observers are attached to the original model by graph modification passes,
+    # they are never called by its forward, so they do not affect tracing results.
+    # training mode is included, since branches on `self.training` are fixed at
+    # trace time (e.g. eval mode calib, then train mode qat).
+    return tuple(
+        (n, type(m), m.training) for n, m in model.named_modules() if not isinstance(m, Observer)
+    )
+
+
+class _TraceCacheEntry(NamedTuple):
+    key: Hashable
+    # pristine graphs, which are never modified by graph modification passes
+    graphs: Dict[str, Graph]
+
+
+class _FreezeObserversOnEval:
+    """
+    Forward pre-hook of proxy models for calibration: observers keep observing in
+    training mode, and are frozen (fake-quant with calibrated qparams) in eval mode,
+    so that validation data never pollutes calibrated qparams.
+    """
+
+    def __init__(self) -> None:
+        # observers are observing when the calibration proxy model is created
+        self.observing = True
+
+    def __call__(self, module: nn.Module, inputs: Any) -> None:
+        if module.training != self.observing:
+            self.observing = module.training
+            toggle_observer(module, observe=self.observing, fake_quant=not self.observing)
+
+
+_REF_CALIB_PASSES = (set_qconfig, fuse_modules, insert_act_observer)
+_REF_QUANTIZE_PASSES = (
+    set_qconfig,
+    fuse_modules,
+    insert_act_observer,
+    observer_to_qdq,
+    quantizable_module_to_ref,
+)
+
+
 class Quantizer:
+    # graph modification passes for each (backend, stage)
+    # TODO(litan.ls): unify graph modification for different backends
+    _PIPELINES: Dict[Tuple[Backend, str], Tuple[GraphModPass, ...]] = {
+        (Backend.DISC, 'calib'): (set_qconfig, insert_act_observer),
+        (Backend.REFERENCE, 'calib'): _REF_CALIB_PASSES,
+        (Backend.FBGEMM, 'calib'): _REF_CALIB_PASSES,
+        (Backend.DISC, 'amp'): (set_qconfig, insert_w_observer, quantizable_module_to_amp),
+        (Backend.REFERENCE, 'amp'): (set_qconfig, fuse_modules, insert_w_observer, quantizable_module_to_amp),
+        (Backend.FBGEMM, 'amp'): (set_qconfig, fuse_modules, insert_w_observer, quantizable_module_to_amp),
+        # 'qat_init' runs with ptq observers, so that weight qparams of qat observers
+        # can be initialized from them in the following 'qat' stage
+        (Backend.REFERENCE, 'qat_init'): (set_qconfig, fuse_modules, insert_w_observer),
+        (Backend.FBGEMM, 'qat_init'): (set_qconfig, fuse_modules, insert_w_observer),
+        (Backend.DISC, 'qat'): (
+            set_qconfig,
+            insert_act_observer,
+            insert_w_observer,
+            # Generally we do not add fake-quant to bias during qat fine-tuning. If
+            # users want to evaluate the accuracy of a model in specific state, they
+            # should use the model returned by `quantizer.quantize`
+            quantizable_module_to_observed,
+        ),
+        (Backend.REFERENCE, 'qat'): (insert_act_observer, insert_w_observer, quantizable_module_to_observed),
+        (Backend.FBGEMM, 'qat'): (insert_act_observer, insert_w_observer, quantizable_module_to_observed),
+        (Backend.DISC, 'quantize'): (
+            set_qconfig,
+            insert_act_observer,
+            insert_w_observer,
+            quantizable_module_to_observed,
+        ),
+        (Backend.REFERENCE, 'quantize'): _REF_QUANTIZE_PASSES,
+        (Backend.FBGEMM, 'quantize'): _REF_QUANTIZE_PASSES + (q_ref_dq_to_fbgemm, fold_qdq),
+    }
+
     def __init__(
         self,
         module_filter: Optional[ModuleFilter] = None,
@@ -151,6 +282,8 @@ class Quantizer:
         w_ob_ctr: Optional[Callable[..., Observer]] = None,
         bias_ob_ctr: Optional[Callable[..., Observer]] = None,
         qat_ob_ctr: Optional[Callable[..., Observer]] = None,
+        calibration_method: str = 'minmax',
+        parallel_submodules: bool = True,
     ) -> None:
         if backend == Backend.FBGEMM and torch.backends.quantized.engine != 'fbgemm':
             LOGGER.warning(
@@ -161,33 +294,147 @@ class Quantizer:
         self.backend = backend
         self.device = device
         self.tracer = tracer
-        self.act_ob_ctr = act_ob_ctr or get_default_ctr(
-            DEFAULT_ACT_OB_CTR, self.device, self.backend
-        )
-        self.w_ob_ctr = w_ob_ctr or get_default_ctr(
-            DEFAULT_W_OB_CTR, self.device, self.backend
-        )
+        if calibration_method not in CALIBRATION_METHODS:
+            raise ValueError(
+                f'Unsupported calibration method {calibration_method}, '
+                f'should be one of {CALIBRATION_METHODS}'
+            )
+        self.calibration_method = calibration_method
+        self.act_ob_ctr = act_ob_ctr or get_default_ctr(DEFAULT_ACT_OB_CTR, self.device, self.backend)
+        if act_ob_ctr is None and calibration_method == 'histogram':
+            # HistogramObserver is much slower than min/max based observers, both in
+            # observing and qparams calculation, so only use it on demand.
+            self.act_ob_ctr = ObserverSpec(HistogramObserver, _get_kwargs(self.act_ob_ctr))
+        self.w_ob_ctr = w_ob_ctr or get_default_ctr(DEFAULT_W_OB_CTR, self.device, self.backend)
         self.bias_ob_ctr = bias_ob_ctr or DEFAULT_BIAS_OB_CTR
         self.qat_ob_ctr = qat_ob_ctr or DEFAULT_QAT_OB_CTR
+        self._qat_act_ob_ctr = _qat_ob_ctr(self.qat_ob_ctr, self.act_ob_ctr)
+        self._qat_w_ob_ctr = _qat_ob_ctr(self.qat_ob_ctr, self.w_ob_ctr)
+        # modify graphs of different traced submodules in a thread pool
+        self.parallel_submodules = parallel_submodules
+        # entries are dropped once their models are garbage-collected
+        self._trace_cache: 'weakref.WeakKeyDictionary[nn.Module, _TraceCacheEntry]' = \
+            weakref.WeakKeyDictionary()
+        # (amp model, its AmpModule names sorted by noise)
+        self._fallback_rank: Optional[Tuple[weakref.ref, List[str]]] = None
+        # models whose submodules were replaced by proxy GraphModules (inplace=True),
+        # they are no longer float models, so no stage can trace them again
+        self._replaced_models: weakref.WeakSet = weakref.WeakSet()
+
+    def _pipeline(self, stage: str) -> Tuple[GraphModPass, ...]:
+        try:
+            return self._PIPELINES[(self.backend, stage)]
+        except KeyError:
+            raise ValueError(f'Unsupported backend {self.backend.name} for {stage}') from None
+
+    def _get_trace_mapping(self, model: nn.Module) -> Dict[str, TracePair]:
+        """
+        Same as `fx_trace`, but reuse the graphs traced in previous calls on the same
+        model, as long as neither the module structure nor the module filter changed.
+        Each call returns newly created GraphModules, so the proxy models returned by
+        different stages (e.g. calib, qat, quantize) never share the same graph.
+        """
+        if model in self._replaced_models:
+            raise RuntimeError(
+                'The model has been modified in place by a previous stage (inplace=True). '
+                'Pass the original float model, or only use inplace=True for the last stage.'
+            )
+        key = (
+            _module_structure_key(model),
+            _module_filter_key(self.module_filter),
+            id(self.tracer),
+        )
+        entry = self._trace_cache.get(model)
+        if entry is not None and entry.key == key:
+            trace_mapping = dict()
+            for name, graph in entry.graphs.items():
+                m = model.get_submodule(name) if name else model
+                trace_mapping[name] = TracePair(gm=GraphModule(m, copy.deepcopy(graph)), m=m)
+            return trace_mapping
 
-    def calib_gm(
-        self, name: str, gm: GraphModule, root: nn.Module, ob_types: ObserverTypes
-    ) -> None:
+        trace_mapping = fx_trace(model, self.module_filter, tracer=self.tracer)
+        graphs = {name: copy.deepcopy(traced.gm.graph) for name, traced in trace_mapping.items()}
+        self._trace_cache[model] = _TraceCacheEntry(key, graphs)
+        return trace_mapping
+
+    def _get_ctx(
+        self,
+        name: str,
+        gm: GraphModule,
+        root: nn.Module,
+        ob_types: ObserverTypes,
+        **kwargs: Any,
+    ) -> GraphModContext:
+        """
+        Create the context to modify the graph of traced submodule `name`.
+        """
         mf = submodule_filter(self.module_filter, name) if self.module_filter else None
-        ctx = GraphModContext(
+        return GraphModContext(
             gm=gm,
             root=root,
             module_filter=mf,
             act_ob_ctr=ob_types.act_ob_ctr,
             w_ob_ctr=ob_types.w_ob_ctr,
             bias_ob_ctr=ob_types.bias_ob_ctr,
+            **kwargs,
         )
-        # TODO(litan.ls): unify graph modification for different backends
-        if self.backend == Backend.DISC:
-            ctx.modify_graph([set_qconfig, insert_act_observer])
-        else:
-            ctx.modify_graph([set_qconfig, fuse_modules, insert_act_observer])
+
+    def _modify_submodules(
+        self,
+        modify_gm: Callable[[str, GraphModule, nn.Module], None],
+        trace_mapping: Dict[str, TracePair],
+    ) -> None:
+        if not self.parallel_submodules or len(trace_mapping) <= 1:
+            for name, traced in trace_mapping.items():
+                modify_gm(name, traced.gm, traced.m)
+            return
+
+        # passes attach observers to the traced root module, so submodules nested
+        # in each other (e.g. 'foo' and 'foo.bar') must not be modified concurrently.
+        def _outermost(name: str) -> str:
+            parents = [n for n in trace_mapping if name == n or name.startswith(f'{n}.')]
+            return min(parents, key=len)
+
+        locks = {n: threading.Lock() for n in trace_mapping}
+
+        def _modify(item: Tuple[str, TracePair]) -> None:
+            name, traced = item
+            with locks[_outermost(name)]:
+                modify_gm(name, traced.gm, traced.m)
+
+        max_workers = min(len(trace_mapping), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(_modify, trace_mapping.items()))
+
+    def _replace(
+        self, model: nn.Module, trace_mapping: Dict[str, TracePair], inplace: bool
+    ) -> nn.Module:
+        if not inplace:
+            return copy_and_replace(model, trace_mapping)
+        proxy = replace_inplace(model, trace_mapping)
+        if proxy is model:
+            self._replaced_models.add(model)
+        return proxy
+
+    def invalidate_trace_cache(self) -> None:
+        """
+        Drop all cached tracing results. Call this if the model is modified in a way
+        that changes its forward but not its module structure between stages.
+        """
+        self._trace_cache.clear()
+
+    def calib_gm(
+        self, name: str, gm: GraphModule, root: nn.Module, ob_types: ObserverTypes,
+        freeze_on_eval: bool = False,
+    ) -> None:
+        ctx = self._get_ctx(name, gm, root, ob_types)
+        # nothing to quantize, e.g. the submodule only contains reshape/embedding ops
+        if not ctx.has_quantizable_nodes():
+            return
+        ctx.modify_graph_fused(self._pipeline('calib'))
         toggle_observer(gm, observe=True, fake_quant=False)
+        if freeze_on_eval:
+            gm.register_forward_pre_hook(_FreezeObserversOnEval())
 
     def calib(
         self,
@@ -195,83 +442,96 @@ class Quantizer:
         act_ob_ctr: Optional[Callable[..., Observer]] = None,
         w_ob_ctr: Optional[Callable[..., Observer]] = None,
         bias_ob_ctr: Optional[Callable[..., Observer]] = None,
+        freeze_on_eval: bool = False,
+        inplace: bool = False,
     ) -> nn.Module:
+        """
+        Create a proxy model for calibration. If `freeze_on_eval` is True, observers
+        of the proxy model only observe in training mode, and are frozen in eval mode.
+        Leave it False if calibration runs in eval mode (e.g. to keep BatchNorm stats).
+
+        If `inplace` is True, traced submodules of `model` are replaced without copying
+        `model`, so `model` itself becomes the proxy model. Later stages need the float
+        model and raise RuntimeError on it, so only use inplace for the last stage.
+        """
         ob_types = ObserverTypes(
             act_ob_ctr or self.act_ob_ctr,
             w_ob_ctr or self.w_ob_ctr,
             bias_ob_ctr or self.bias_ob_ctr,
         )
-        trace_mapping = fx_trace(model, self.module_filter, tracer=self.tracer)
-        for name, traced in trace_mapping.items():
-            self.calib_gm(name, traced.gm, traced.m, ob_types)
-        return copy_and_replace(model, trace_mapping)
+        trace_mapping = self._get_trace_mapping(model)
+        calib_gm = partial(self.calib_gm, ob_types=ob_types, freeze_on_eval=freeze_on_eval)
+        self._modify_submodules(calib_gm, trace_mapping)
+        return self._replace(model, trace_mapping, inplace)
+
+    def freeze_observers(self, model: nn.Module) -> None:
+        """
+        Stop updating qparams, and fake-quantize with the calibrated ones, e.g. before
+        evaluating the accuracy of a calibration proxy model.
+        """
+        toggle_observer(model, observe=False, fake_quant=True)
+
+    @contextmanager
+    def calibration_only(self, model: nn.Module) -> Iterator[nn.Module]:
+        """
+        Observers of `model` only observe within the context, and are frozen on exit.
+        """
+        toggle_observer(model, observe=True, fake_quant=False)
+        try:
+            yield model
+        finally:
+            self.freeze_observers(model)
 
     def amp_gm(self, name: str, gm: GraphModule, root: nn.Module) -> None:
-        mf = submodule_filter(self.module_filter, name) if self.module_filter else None
-        ctx = GraphModContext(
-            gm=gm,
-            root=root,
-            module_filter=mf,
-            act_ob_ctr=self.act_ob_ctr,
-            w_ob_ctr=self.w_ob_ctr,
-            bias_ob_ctr=self.bias_ob_ctr,
-            is_override_module=False,
-            is_override_qconfig=False,
+        ob_types = ObserverTypes(self.act_ob_ctr, self.w_ob_ctr, self.bias_ob_ctr)
+        ctx = self._get_ctx(
+            name, gm, root, ob_types, is_override_module=False, is_override_qconfig=False
         )
-        if self.backend == Backend.DISC:
-            ctx.modify_graph([set_qconfig, insert_w_observer, quantizable_module_to_amp])
-        else:
-            ctx.modify_graph([set_qconfig, fuse_modules, insert_w_observer, quantizable_module_to_amp])
+        if not ctx.has_quantizable_nodes():
+            return
+        ctx.modify_graph_fused(self._pipeline('amp'))
         toggle_observer(gm, observe=False, fake_quant=True)
 
-    def amp(self, model: nn.Module) -> nn.Module:
-        trace_mapping = fx_trace(model, self.module_filter, tracer=self.tracer)
-        for name, traced in trace_mapping.items():
-            self.amp_gm(name, traced.gm, traced.m)
-        return copy_and_replace(model, trace_mapping)
+    def amp(self, model: nn.Module, inplace: bool = False) -> nn.Module:
+        """
+        Create a proxy model for mixed precision analysis. See `calib` for `inplace`.
+        """
+        trace_mapping = self._get_trace_mapping(model)
+        self._modify_submodules(self.amp_gm, trace_mapping)
+        return self._replace(model, trace_mapping, inplace)
 
     def fallback(self, model: nn.Module, num: int) -> None:
+        """
+        Fallback the `num` noisiest modules of the amp model to float precision. The
+        ranking is computed once per amp model, so `num` can be swept cheaply. Create
+        a new amp model (i.e. call `amp` again) to rank with noise of new data.
+        """
+        if self._fallback_rank is None or self._fallback_rank[0]() is not model:
+            self._fallback_rank = (weakref.ref(model), rank_fallback_candidates(model))
+        fallback_names = get_fallback_names(model, num, self._fallback_rank[1])
         self.module_filter = self.module_filter or ModuleFilter()
         self.module_filter.exclude_names = self.module_filter.exclude_names or list()
-        self.module_filter.exclude_names.extend(get_fallback_names(model, num))
+        excluded = set(self.module_filter.exclude_names)
+        self.module_filter.exclude_names.extend(n for n in fallback_names if n not in excluded)
 
     def qat_gm(
         self, name: str, gm: GraphModule, root: nn.Module, ob_types: ObserverTypes
     ) -> None:
-        mf = submodule_filter(self.module_filter, name) if self.module_filter else None
-        ctx = GraphModContext(
-            gm=gm,
-            root=root,
-            module_filter=mf,
-            act_ob_ctr=ob_types.act_ob_ctr,
-            w_ob_ctr=ob_types.w_ob_ctr,
-            bias_ob_ctr=ob_types.bias_ob_ctr,
-        )
-        if self.backend == Backend.DISC:
-            ctx.modify_graph([
-                set_qconfig,
-                insert_act_observer,
-                insert_w_observer,
-                # Generally we do not add fake-quant to bias during qat fine-tuning. If
-                # users want to evaluate the accuracy of a model in specific state, they
-                # should use the model returned by `quantizer.quantize`
-                quantizable_module_to_observed])
-        else:
+        ctx = self._get_ctx(name, gm, root, ob_types)
+        if not ctx.has_quantizable_nodes():
+            return
+        init_passes = self._PIPELINES.get((self.backend, 'qat_init'))
+        if init_passes:
             ctx.act_ob_ctr = self.act_ob_ctr
             ctx.w_ob_ctr = self.w_ob_ctr
             ctx.bias_ob_ctr = self.bias_ob_ctr
-            ctx.modify_graph([set_qconfig, fuse_modules, insert_w_observer])
+            # recompiled once after the 'qat' stage
+            ctx.modify_graph_fused(init_passes, recompile=False)
 
             ctx.act_ob_ctr = ob_types.act_ob_ctr
             ctx.w_ob_ctr = ob_types.w_ob_ctr
             ctx.bias_ob_ctr = ob_types.bias_ob_ctr
-            ctx.modify_graph(
-                [
-                    insert_act_observer,
-                    insert_w_observer,
-                    quantizable_module_to_observed,
-                ]
-            )
+        ctx.modify_graph_fused(self._pipeline('qat'))
         toggle_observer(gm, observe=False, fake_quant=True)
 
     def qat(
@@ -280,65 +540,42 @@ class Quantizer:
         act_ob_ctr: Optional[Callable[..., Observer]] = None,
         w_ob_ctr: Optional[Callable[..., Observer]] = None,
         bias_ob_ctr: Optional[Callable[..., Observer]] = None,
+        inplace: bool = False,
     ) -> nn.Module:
-        # Generally we will keep the qat's dtype & qscheme settings the same as ptq.
-        settings = ['qscheme', 'dtype']
-        kwds = lambda keywords: {k: v for k, v in keywords.items() if k in settings}
-        if act_ob_ctr is None:
-            act_ob_ctr = partial(self.qat_ob_ctr, **kwds(self.act_ob_ctr.keywords))
-        if w_ob_ctr is None:
-            w_ob_ctr = partial(self.qat_ob_ctr, **kwds(self.w_ob_ctr.keywords))
-        ob_types = ObserverTypes(act_ob_ctr, w_ob_ctr, bias_ob_ctr)
-        trace_mapping = fx_trace(model, self.module_filter, tracer=self.tracer)
-        for name, traced in trace_mapping.items():
-            self.qat_gm(name, traced.gm, traced.m, ob_types)
-        return copy_and_replace(model, trace_mapping)
+        """
+        Create a proxy model for quantization-aware training. See `calib` for `inplace`.
+        """
+        ob_types = ObserverTypes(
+            act_ob_ctr or self._qat_act_ob_ctr,
+            w_ob_ctr or self._qat_w_ob_ctr,
+            bias_ob_ctr,
+        )
+        trace_mapping = self._get_trace_mapping(model)
+        self._modify_submodules(partial(self.qat_gm, ob_types=ob_types), trace_mapping)
+        return self._replace(model, trace_mapping, inplace)
 
     def quantize_gm(self, name: str, gm: GraphModule, root: nn.Module) -> None:
-        mf = submodule_filter(self.module_filter, name) if self.module_filter else None
-        ctx = GraphModContext(
-            gm=gm,
-            root=root,
-            module_filter=mf,
-            act_ob_ctr=self.act_ob_ctr,
-            w_ob_ctr=self.w_ob_ctr,
-            bias_ob_ctr=self.bias_ob_ctr,
-            is_override_module=False,
-            is_override_qconfig=False,
+        ob_types = ObserverTypes(self.act_ob_ctr, self.w_ob_ctr, self.bias_ob_ctr)
+        ctx = self._get_ctx(
+            name, gm, root, ob_types, is_override_module=False, is_override_qconfig=False
         )
+        if not ctx.has_quantizable_nodes():
+            return
+        ctx.modify_graph_fused(self._pipeline('quantize'))
         if self.backend == Backend.DISC:
-            ctx.modify_graph([
-                set_qconfig,
-                insert_act_observer,
-                insert_w_observer,
-                quantizable_module_to_observed,
-            ])
+            # DISC keeps observers in the quantized model as fake-quant
             toggle_observer(gm, observe=False, fake_quant=True)
-        elif self.backend == Backend.REFERENCE:
-            ctx.modify_graph([
-                set_qconfig,
-                fuse_modules,
-                insert_act_observer,
-                observer_to_qdq,
-                quantizable_module_to_ref,
-            ])
-        elif self.backend == Backend.FBGEMM:
-            ctx.modify_graph([
-                set_qconfig,
-                fuse_modules,
-                insert_act_observer,
-                observer_to_qdq,
-                quantizable_module_to_ref,
-                q_ref_dq_to_fbgemm,
-                fold_qdq,
-            ])
-        else:
-            raise ValueError(f'Unsupported backend {self.backend.name}')
-        # remove unused modules (e.g. observers) or the following tracing might fail
-        ctx.gm.delete_all_unused_submodules()
-
-    def quantize(self, model: nn.Module) -> nn.Module:
-        trace_mapping = fx_trace(model, self.module_filter, tracer=self.tracer)
-        for name, traced in trace_mapping.items():
-            self.quantize_gm(name, traced.gm, traced.m)
-        return copy_and_replace(model, trace_mapping)
+        # remove unused modules (e.g. observers) or the following tracing might fail,
+        # modules only become unused when passes erase their call_module nodes
+        if ctx.removed_modules:
+            ctx.gm.delete_all_unused_submodules()
+
+    def quantize(self, model: nn.Module, inplace: bool = False) -> nn.Module:
+        """
+        Create the quantized proxy model. With `inplace=True`, traced submodules of
+        `model` are replaced without copying `model`, which saves memory for large
+        models, but `model` can not be passed to any stage afterwards.
+        """
+        trace_mapping = self._get_trace_mapping(model)
+        self._modify_submodules(self.quantize_gm, trace_mapping)
+        return self._replace(model, trace_mapping, inplace)